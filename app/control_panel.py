@@ -1,31 +1,52 @@
 #!/usr/bin/env python3
 
+import os
 import sys
+import errno
+import atexit
 import json
+import mmap
+import struct
 import subprocess
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Optional, Dict, List, Set, Tuple
+from typing import Callable, Optional, Dict, List, Set, Tuple
+
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib encoder is fine, just slower
+    orjson = None
 
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QComboBox, QSlider, QFrame, QFileDialog,
-    QGraphicsDropShadowEffect, QScrollArea, QSizePolicy,
+    QScrollArea, QSizePolicy,
     QSystemTrayIcon, QMenu, QButtonGroup,
 )
-from PySide6.QtCore import Qt, QTimer, Signal
+from PySide6.QtCore import (
+    Qt, QTimer, QObject, QSignalBlocker, Signal, QFileSystemWatcher, QRunnable, QThreadPool,
+)
 from PySide6.QtGui import (
     QColor, QPalette, QIcon, QPixmap, QPainter, QAction, QImage, QFont,
 )
-from PySide6.QtSvg import QSvgRenderer
 
 # ── Paths ────────────────────────────────────────────────────────────────
 CMD_PIPE       = "/tmp/blucast/cmd.pipe"
 PREVIEW_FILE   = "/tmp/blucast/preview.jpg"
+PREVIEW_SHM    = "/dev/shm/blucast-preview"
 CONFIG_DIR     = Path("/root/.config/blucast")
 CONFIG_FILE    = CONFIG_DIR / "settings.json"
+CONFIG_BACKUP  = CONFIG_DIR / "settings.json.bak"
 LOGO_PATH      = "/app/assets/logo.svg"
 VCAM_DEVICE    = "/dev/video10"
+HOST_HOME      = "/host_home"
+
+# Fixed by the image and the container mounts, so checked once
+HAS_LOGO       = os.path.exists(LOGO_PATH)
+HAS_HOST_HOME  = os.path.isdir(HOST_HOME)
 
 # ── Effect mapping ───────────────────────────────────────────────────────
 EFFECT_MAP = {
@@ -35,17 +56,53 @@ EFFECT_MAP = {
     "none":    4,
 }
 
+_MODE_COMMANDS = {k: f"MODE:{v}" for k, v in EFFECT_MAP.items()}
+
+# Server command for each persisted setting, in the order _send_all emits them
+SETTING_COMMANDS = {
+    "effect_mode":      lambda v: _MODE_COMMANDS.get(v, "MODE:6"),
+    "input_device":     lambda v: f"DEVICE:{v}",
+    "background_image": lambda v: f"BG:{v}",
+    "blur_strength":    lambda v: f"BLUR:{v / 100.0}",
+    "resolution":       lambda v: f"RESOLUTION:{v}",
+    "fps":              lambda v: f"FPS:{v}",
+}
+
+# Settings swept by sliders/combos, whose command is dropped when the server
+# already has the value. BG and DEVICE are always resent, so re-picking the
+# same (possibly edited) background makes the server reload it.
+DEDUP_SETTINGS = frozenset({"blur_strength", "resolution", "fps"})
+
+EFFECT_BUTTONS = (
+    ("blur",    "BLUR"),
+    ("replace", "REPLACE"),
+    ("remove",  "REMOVE"),
+    ("none",    "NONE"),
+)
+
 DEFAULT_FORMATS = {
     "640x480":   [15, 24, 30, 60],
     "1280x720":  [15, 24, 30, 60],
     "1920x1080": [15, 24, 30, 60],
 }
 
+# (width, height, "WxH") so callers never re-split or re-format them
 STANDARD_RESOLUTIONS = [
-    (320, 240), (640, 480), (800, 600), (960, 540), (1024, 576),
-    (1280, 720), (1600, 900), (1920, 1080), (2560, 1440), (3840, 2160),
+    (w, h, f"{w}x{h}") for w, h in (
+        (320, 240), (640, 480), (800, 600), (960, 540), (1024, 576),
+        (1280, 720), (1600, 900), (1920, 1080), (2560, 1440), (3840, 2160),
+    )
 ]
 
+# Frame rates offered when a device only reports a stepwise interval range
+STEPWISE_FPS = (15, 24, 30, 60, 120)
+
+# Pixel sizes the tray icon is pre-rendered at
+TRAY_ICON_SIZES = (16, 32, 64)
+
+# Shared size policy for full-width combo rows
+SP_EXPAND_FIXED = QSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+
 # ── Stylesheet ───────────────────────────────────────────────────────────
 STYLESHEET = """
 QMainWindow { background-color: #0a0f0a; }
@@ -64,12 +121,47 @@ QComboBox QAbstractItemView {
     selection-background-color: #3b82f6; padding: 4px; outline: none;
 }
 QComboBox QAbstractItemView::item { padding: 8px 12px; border-radius: 6px; min-height: 24px; }
+QFrame#card { background: #111611; border: 1px solid #1f2a1f; border-radius: 16px; }
 QPushButton {
     background: #1a1f1a; border: 1px solid #2d3d2d; border-radius: 10px;
     padding: 12px 20px; font-size: 14px; font-weight: 500; color: #94a3b8;
 }
 QPushButton:hover { background: #1f2a1f; border-color: #3d4d3d; }
 QPushButton:pressed { background: #2d3d2d; }
+QPushButton#effect_btn {
+    background: #1a1f1a; border: 1px solid #2d3d2d; color: #64748b;
+    border-radius: 12px; padding: 8px; font-weight: 500; font-size: 11px;
+}
+QPushButton#effect_btn:hover { background: #1f2a1f; border-color: #3d4d3d; }
+QPushButton#effect_btn:checked {
+    background: #3b82f6; border: 2px solid #3b82f6; color: white; font-weight: 600;
+}
+QPushButton#effect_btn:checked:hover { background: #2563eb; }
+QLabel#bg_path { color: #64748b; font-size: 12px; background: transparent; }
+QLabel#bg_path[selected="true"] { color: #e2e8f0; }
+QWidget#preview_box { background: #0d120d; border-radius: 12px; }
+QLabel#placeholder { color: #64748b; font-size: 13px; background: transparent; }
+QLabel#preview_info { color: #64748b; font-size: 11px; background: transparent; padding: 4px; }
+QLabel#section_title { font-size: 14px; font-weight: 600; color: #fff; background: transparent; }
+QLabel#field_label { color: #94a3b8; font-size: 12px; background: transparent; }
+QLabel#status_label { font-size: 12px; color: #64748b; background: transparent; }
+QLabel#status_dot { color: #22c55e; font-size: 22px; background: transparent; }
+QLabel#blur_value { color: #3b82f6; font-size: 13px; font-weight: 600; background: transparent; }
+QPushButton#bg_browse {
+    background: #3b82f6; border: none; color: white;
+    border-radius: 8px; padding: 8px 16px; font-weight: 500;
+}
+QPushButton#bg_browse:hover { background: #2563eb; }
+QPushButton#refresh_btn {
+    background: #1a1f1a; border: 1px solid #2d3d2d; border-radius: 10px;
+    font-size: 18px; color: #94a3b8; padding: 8px;
+}
+QPushButton#refresh_btn:hover { background: #1f2a1f; border-color: #3b82f6; color: #3b82f6; }
+QPushButton#quit_btn {
+    background: #1a1515; border: 1px solid #3d2d2d; color: #ef4444;
+    border-radius: 10px; padding: 14px; font-size: 14px; font-weight: 600;
+}
+QPushButton#quit_btn:hover { background: #2d1f1f; border-color: #4d3d3d; }
 QSlider::groove:horizontal { background: #2d3d2d; height: 8px; border-radius: 4px; }
 QSlider::handle:horizontal {
     background: #3b82f6; width: 20px; height: 20px; margin: -6px 0;
@@ -86,121 +178,225 @@ QSlider::sub-page:horizontal {
 # Helpers
 # ═════════════════════════════════════════════════════════════════════════
 
+_pipe_fd: Optional[int] = None
+
+
+def _open_pipe() -> int:
+    """Return the cached write end of the command pipe, opening it if needed."""
+    global _pipe_fd
+    if _pipe_fd is None:
+        _pipe_fd = os.open(CMD_PIPE, os.O_WRONLY | os.O_NONBLOCK)
+    return _pipe_fd
+
+
+def _close_pipe():
+    global _pipe_fd
+    if _pipe_fd is not None:
+        try:
+            os.close(_pipe_fd)
+        except OSError:
+            pass
+        _pipe_fd = None
+
+
+atexit.register(_close_pipe)
+
+
 def send_command(cmd: str) -> bool:
     """Send a command to the server via named pipe."""
-    try:
-        with open(CMD_PIPE, 'w') as f:
-            f.write(cmd + '\n')
+    return send_commands([cmd])
+
+
+def send_commands(cmds: List[str]) -> bool:
+    """Send several commands in one write.
+
+    Writes up to PIPE_BUF bytes are atomic, so a batch never interleaves
+    with another writer. The server may still receive it split across
+    reads; it buffers the partial trailing line until its newline arrives.
+    """
+    if not cmds:
         return True
+    data = ('\n'.join(cmds) + '\n').encode()
+    for _ in range(2):
+        try:
+            os.write(_open_pipe(), data)
+            return True
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return False  # No server reading the pipe; fail fast
+            if e.errno == errno.EAGAIN:
+                return False  # Pipe full; drop rather than stall the GUI
+            # Stale fd (server restarted and recreated the FIFO): reopen
+            # once and retry.
+            _close_pipe()
+    return False
+
+
+@lru_cache(maxsize=128)
+def _parse_res(res: str) -> Tuple[int, int]:
+    """Parse a "WxH" string into (width, height)."""
+    w, h = res.split("x")
+    return int(w), int(h)
+
+
+# v4l2-ctl output patterns
+_FORMAT_RE = re.compile(
+    r"(?P<size>Size:\s+Discrete\s+(?P<dw>\d+)x(?P<dh>\d+))"
+    r"|(?P<step>Size:\s+Stepwise\s+(?P<sw1>\d+)x(?P<sh1>\d+)\s*-\s*(?P<sw2>\d+)x(?P<sh2>\d+))"
+    r"|(?P<fps>\((?P<fps_val>[\d.]+)\s*fps\))"
+    r"|(?P<frac>Interval:\s+Discrete\s+(?P<n>\d+)\s*/\s*(?P<d>\d+))"
+    r"|(?P<step_fps>Interval:\s+Stepwise\s+(?P<smin>[\d.]+)s\s*-\s*(?P<smax>[\d.]+)s)"
+)
+
+# Probe results, keyed on the mtime of /dev (devices) or of the device node
+# (formats) so hotplug invalidates them.
+_dev_cache: Optional[Tuple[int, List[Tuple[str, str]]]] = None
+_fmt_cache: Dict[str, Tuple[int, Dict[str, List[int]]]] = {}
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
     except OSError:
-        return False
+        return None
+
+
+def invalidate_device_cache():
+    """Forget cached device lists and formats so the next query re-probes.
+
+    Card names of unchanged nodes stay cached; failed lookups never are.
+    """
+    global _dev_cache
+    _dev_cache = None
+    _fmt_cache.clear()
 
 
 def get_video_devices() -> List[Tuple[str, str]]:
     """Return list of (path, name) for real camera devices (excluding our vcam)."""
-    devices = []
+    global _dev_cache
+    mtime = _mtime_ns("/dev")
+    if _dev_cache is None or mtime is None or _dev_cache[0] != mtime:
+        _dev_cache = (mtime, _probe_video_devices())
+    return _dev_cache[1] or [("/dev/video0", "Default Camera")]
+
+
+@lru_cache(maxsize=32)
+def _card_name(path: str, mtime_ns: Optional[int]) -> str:
+    # Keyed on the node's mtime: a replugged camera gets a new node and
+    # is looked up again, an unchanged one is not re-forked on refresh.
+    # Failures raise, so lru_cache never stores them.
+    res = subprocess.run(
+        ["v4l2-ctl", "-d", path, "--info"],
+        capture_output=True, text=True, timeout=1,
+    )
+    for line in res.stdout.splitlines():
+        if "Card type" in line:
+            return line.split(":", 1)[1].strip()
+    raise LookupError(path)
+
+
+def _device_name(path: str, mtime_ns: Optional[int]) -> str:
     try:
-        for entry in sorted(Path("/dev").iterdir()):
-            if not entry.name.startswith("video"):
-                continue
-            path = str(entry)
-            if path == VCAM_DEVICE:
-                continue
-            try:
-                res = subprocess.run(
-                    ["v4l2-ctl", "-d", path, "--info"],
-                    capture_output=True, text=True, timeout=1,
-                )
-                name = "Unknown Camera"
-                for line in res.stdout.splitlines():
-                    if "Card type" in line:
-                        name = line.split(":", 1)[1].strip()
-                        break
-                devices.append((path, name))
-            except Exception:
-                devices.append((path, f"Camera ({entry.name})"))
-    except Exception:
-        pass
-    return devices or [("/dev/video0", "Default Camera")]
+        return _card_name(path, mtime_ns)
+    except LookupError:
+        return "Unknown Camera"
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return f"Camera ({os.path.basename(path)})"
+
+
+def _probe_video_devices() -> List[Tuple[str, str]]:
+    try:
+        with os.scandir("/dev") as it:
+            names = sorted(e.name for e in it if e.name.startswith("video"))
+    except OSError:
+        return []
+    paths = [p for p in ("/dev/" + n for n in names) if p != VCAM_DEVICE]
+    if not paths:
+        return []
+    mtimes = [_mtime_ns(p) for p in paths]
+    # Each --info call is an independent subprocess; run them side by side
+    with ThreadPoolExecutor(max_workers=min(4, len(paths))) as pool:
+        return list(zip(paths, pool.map(_device_name, paths, mtimes)))
+
+
+def cached_supported_formats(device: str) -> Optional[Dict[str, List[int]]]:
+    """Return the cached formats for device if still current, without probing."""
+    mtime = _mtime_ns(device)
+    cached = _fmt_cache.get(device)
+    if cached is not None and mtime is not None and cached[0] == mtime:
+        return cached[1]
+    return None
 
 
 def get_supported_formats(device: str) -> Dict[str, List[int]]:
     """Query device for supported resolutions and frame rates."""
+    cached = cached_supported_formats(device)
+    if cached is not None:
+        return cached
+    mtime = _mtime_ns(device)
+    formats = _query_formats(device)
+    if formats and mtime is not None:
+        _fmt_cache[device] = (mtime, formats)
+    return formats
+
+
+def _query_formats(device: str) -> Dict[str, List[int]]:
     try:
         res = subprocess.run(
             ["v4l2-ctl", "-d", device, "--list-formats-ext"],
             capture_output=True, text=True, timeout=2,
         )
-    except Exception:
+    except (OSError, ValueError, subprocess.SubprocessError):
         return {}
 
     output = res.stdout or ""
     if not output:
         return {}
 
-    size_re = re.compile(r"Size:\s+Discrete\s+(\d+)x(\d+)")
-    step_re = re.compile(r"Size:\s+Stepwise\s+(\d+)x(\d+)\s*-\s*(\d+)x(\d+)")
-    fps_re  = re.compile(r"\(([\d.]+)\s*fps\)")
-    frac_re = re.compile(r"Interval:\s+Discrete\s+(\d+)\s*/\s*(\d+)")
-    step_fps_re = re.compile(r"Interval:\s+Stepwise\s+([\d.]+)s\s*-\s*([\d.]+)s")
-
     formats: Dict[str, Set[int]] = {}
     current_res = None
     stepwise_range = None
     stepwise_fps: Set[int] = set()
     stepwise_fps_range = None
 
-    for line in output.splitlines():
-        m = size_re.search(line)
-        if m:
-            current_res = f"{m.group(1)}x{m.group(2)}"
+    # One scan over the raw output; the outer named group tells us which
+    # kind of line matched.
+    for m in _FORMAT_RE.finditer(output):
+        kind = m.lastgroup
+        if kind == "size":
+            current_res = f"{m['dw']}x{m['dh']}"
             formats.setdefault(current_res, set())
-            continue
-
-        m = step_re.search(line)
-        if m:
-            stepwise_range = tuple(map(int, m.groups()))
+        elif kind == "step":
+            stepwise_range = (int(m["sw1"]), int(m["sh1"]), int(m["sw2"]), int(m["sh2"]))
             current_res = None
-            continue
-
-        m = fps_re.search(line)
-        if m:
-            fps = int(round(float(m.group(1))))
+        elif kind == "step_fps":
+            min_s, max_s = float(m["smin"]), float(m["smax"])
+            if min_s > 0 and max_s > 0:
+                stepwise_fps_range = (int(round(1 / max_s)), int(round(1 / min_s)))
+        else:
+            if kind == "fps":
+                fps = int(round(float(m["fps_val"])))
+            else:
+                n = float(m["n"])
+                if n <= 0:
+                    continue
+                fps = int(round(float(m["d"]) / n))
             if 0 < fps <= 240:
                 if current_res:
                     formats.setdefault(current_res, set()).add(fps)
                 else:
                     stepwise_fps.add(fps)
-            continue
-
-        m = frac_re.search(line)
-        if m:
-            n, d = float(m.group(1)), float(m.group(2))
-            if n > 0:
-                fps = int(round(d / n))
-                if 0 < fps <= 240:
-                    if current_res:
-                        formats.setdefault(current_res, set()).add(fps)
-                    else:
-                        stepwise_fps.add(fps)
-            continue
-
-        m = step_fps_re.search(line)
-        if m:
-            min_s, max_s = float(m.group(1)), float(m.group(2))
-            if min_s > 0 and max_s > 0:
-                stepwise_fps_range = (int(round(1 / max_s)), int(round(1 / min_s)))
 
     if formats:
         return {r: sorted(f) for r, f in formats.items() if f}
 
     if stepwise_range:
         min_w, min_h, max_w, max_h = stepwise_range
-        resolutions = [f"{w}x{h}" for w, h in STANDARD_RESOLUTIONS
+        resolutions = [r for w, h, r in STANDARD_RESOLUTIONS
                        if min_w <= w <= max_w and min_h <= h <= max_h]
         if stepwise_fps_range:
             lo, hi = stepwise_fps_range
-            fps_list = [f for f in [15, 24, 30, 60, 120] if lo <= f <= hi]
+            fps_list = [f for f in STEPWISE_FPS if lo <= f <= hi]
         else:
             fps_list = sorted(stepwise_fps) or [30]
         return {r: fps_list for r in resolutions} if resolutions else {}
@@ -208,11 +404,168 @@ def get_supported_formats(device: str) -> Dict[str, List[int]]:
     return {}
 
 
+class DeviceScanWorker(QObject, QRunnable):
+    """Probe devices and their formats on the thread pool.
+
+    v4l2-ctl can take up to a couple of seconds per device, so a rescan
+    must not run on the UI thread. Results also land in the probe caches.
+    """
+
+    finished = Signal(list)
+
+    def __init__(self):
+        QObject.__init__(self)
+        QRunnable.__init__(self)
+        # The panel holds the reference until finished is delivered
+        self.setAutoDelete(False)
+
+    def run(self):
+        devices = get_video_devices()
+        # Warm the format cache so switching devices afterwards is instant;
+        # like the --info probes these are independent subprocesses.
+        if devices:
+            with ThreadPoolExecutor(max_workers=min(4, len(devices))) as pool:
+                list(pool.map(get_supported_formats, [path for path, _ in devices]))
+        self.finished.emit(devices)
+
+
+class FormatScanWorker(QObject, QRunnable):
+    """Probe one device's formats on the thread pool."""
+
+    finished = Signal(int, dict)
+
+    def __init__(self, request: int, device: str):
+        QObject.__init__(self)
+        QRunnable.__init__(self)
+        self.setAutoDelete(False)
+        self.request = request
+        self._device = device
+
+    def run(self):
+        self.finished.emit(self.request, get_supported_formats(self._device))
+
+
+class PreviewDecoder(QObject, QRunnable):
+    """Decode and scale one JPEG preview frame on the thread pool."""
+
+    done = Signal(QImage, tuple)
+
+    def __init__(self, sig: tuple, target: Tuple[int, int], mode: Qt.TransformationMode):
+        QObject.__init__(self)
+        QRunnable.__init__(self)
+        self.setAutoDelete(False)
+        self._sig = sig
+        self._target = target
+        self._mode = mode
+
+    def run(self):
+        try:
+            with open(PREVIEW_FILE, "rb") as f:
+                img = QImage.fromData(f.read(), "JPG")
+        except OSError:
+            img = QImage()
+        if not img.isNull():
+            img = img.scaled(*self._target, Qt.KeepAspectRatio, self._mode)
+        self.done.emit(img, self._sig)
+
+
+class PreviewShm:
+    """Reader for the raw BGR preview the server publishes in shared memory.
+
+    The layout matches PreviewShm in server.cpp: a 32-byte header, then
+    height * stride pixel bytes. seq is odd while the server is writing, so
+    a copy is only kept if seq was even and unchanged around it.
+    """
+
+    _HEADER = struct.Struct("<4sIIII")  # magic, seq, width, height, stride
+    _HEADER_SIZE = 32
+
+    def __init__(self):
+        self._mm: Optional[mmap.mmap] = None
+        self._ino = 0
+        self._seq = 0
+
+    @property
+    def mapped(self) -> bool:
+        return self._mm is not None
+
+    def is_open(self) -> bool:
+        """Map the segment, remapping if the server replaced it."""
+        try:
+            st = os.stat(PREVIEW_SHM)
+        except OSError:
+            self.close()
+            return False
+        if st.st_ino != self._ino:
+            self.close()
+            if st.st_size <= self._HEADER_SIZE:
+                return False  # not sized yet
+            try:
+                fd = os.open(PREVIEW_SHM, os.O_RDONLY)
+                try:
+                    self._mm = mmap.mmap(fd, st.st_size, mmap.MAP_SHARED, mmap.PROT_READ)
+                finally:
+                    os.close(fd)
+            except (OSError, ValueError):
+                return False
+            self._ino = st.st_ino
+        return True
+
+    def read(self, convert: Callable[[QImage], QImage]) -> Optional[QImage]:
+        """Return convert(frame) for the newest complete frame, or None.
+
+        The frame is wrapped in place, so convert must produce an image that
+        owns its pixels (e.g. a scaled copy). The result is discarded if the
+        server started writing a newer frame meanwhile.
+        """
+        mm = self._mm
+        if mm is None:
+            return None
+        magic, seq, w, h, stride = self._HEADER.unpack_from(mm)
+        if magic != b"BCPV" or seq & 1 or seq == self._seq:
+            return None
+        end = self._HEADER_SIZE + h * stride
+        if end > len(mm):
+            return None
+        view = memoryview(mm)[self._HEADER_SIZE:end]
+        try:
+            frame = QImage(view, w, h, stride, QImage.Format_BGR888)
+            out = convert(frame)
+            if out.size() == frame.size():
+                out = out.copy()  # scaled() to the same size is a shallow copy
+            del frame
+        finally:
+            view.release()
+        if self._HEADER.unpack_from(mm)[1] != seq:
+            return None  # torn, the next tick picks up the new frame
+        self._seq = seq
+        return out
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._ino = 0
+        self._seq = 0
+
+
 # ═════════════════════════════════════════════════════════════════════════
 # Settings
 # ═════════════════════════════════════════════════════════════════════════
 
-class Settings:
+if orjson is not None:
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+else:
+    _json_loads = json.loads
+
+    def _json_dumps(data) -> bytes:
+        return json.dumps(data, separators=(",", ":")).encode()
+
+
+class Settings(QObject):
+    SAVE_DELAY_MS = 250
+
     DEFAULTS = {
         "effect_mode": "blur",
         "background_image": "",
@@ -222,25 +575,83 @@ class Settings:
         "input_device": "",
     }
 
-    def __init__(self):
+    def __init__(self, parent=None):
+        super().__init__(parent)
         self._data = self.DEFAULTS.copy()
-        try:
-            if CONFIG_FILE.exists():
-                self._data.update(json.loads(CONFIG_FILE.read_text()))
-        except Exception:
-            pass
+        self._last_blob: Optional[bytes] = None  # Payload of the last write
+        # Fall back to the previous good copy if the main file is unreadable.
+        # Each file is validated on its own before anything is merged.
+        for path in (CONFIG_FILE, CONFIG_BACKUP):
+            try:
+                if not path.exists():
+                    continue
+                loaded = _json_loads(path.read_bytes())
+                if not isinstance(loaded, dict):
+                    raise ValueError("settings file is not a JSON object")
+                data = {**self._data, **loaded}
+                blob = _json_dumps(data)
+            except (OSError, TypeError, ValueError):
+                continue  # Unreadable or corrupt, try the backup
+            self._data = data
+            if path == CONFIG_FILE:
+                self._last_blob = blob
+            break
+
+        # Coalesce bursts of set() calls (slider drags) into a single write
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(self.SAVE_DELAY_MS)
+        self._save_timer.timeout.connect(self.save)
 
     def get(self, key):
         return self._data.get(key, self.DEFAULTS.get(key))
 
     def set(self, key, value):
+        # Only a shortcut to avoid arming the timer; save() decides whether
+        # to write by comparing the serialized payload.
+        if self._data.get(key) == value:
+            return
         self._data[key] = value
+        self._save_timer.start()
+
+    def save(self):
         try:
+            blob = _json_dumps(self._data)
+            if blob == self._last_blob:
+                return  # Nothing changed since the last write
             CONFIG_DIR.mkdir(parents=True, exist_ok=True)
-            CONFIG_FILE.write_text(json.dumps(self._data, indent=2))
-        except Exception:
+            tmp = CONFIG_FILE.with_suffix(".json.tmp")
+            with open(tmp, "wb") as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            if self._last_blob is not None:
+                # Only a file we loaded or wrote is known good; one that
+                # failed to parse must not replace the backup.
+                self._backup_current()
+            os.replace(tmp, CONFIG_FILE)
+            self._last_blob = blob
+        except (OSError, TypeError, ValueError):
             pass
 
+    @staticmethod
+    def _backup_current():
+        """Hard-link the current settings file over the backup atomically."""
+        link = CONFIG_BACKUP.with_suffix(".bak.tmp")
+        try:
+            if os.path.lexists(link):
+                os.unlink(link)
+            os.link(CONFIG_FILE, link)
+            os.replace(link, CONFIG_BACKUP)
+        except OSError:
+            pass  # Keep the previous backup; the new file is still written
+
+    def flush(self):
+        """Write any pending changes immediately."""
+        if self._save_timer.isActive():
+            self._save_timer.stop()
+            self.save()
+
 
 # ═════════════════════════════════════════════════════════════════════════
 # Reusable widgets
@@ -250,13 +661,6 @@ class Card(QFrame):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setObjectName("card")
-        self.setStyleSheet("""
-            #card {
-                background: #111611;
-                border: 1px solid #1f2a1f;
-                border-radius: 16px;
-            }
-        """)
 
 
 class EffectButton(QPushButton):
@@ -265,26 +669,7 @@ class EffectButton(QPushButton):
         self.setCheckable(True)
         self.setMinimumHeight(70)
         self.setMinimumWidth(75)
-        self._apply(False)
-        self.toggled.connect(self._apply)
-
-    def _apply(self, checked):
-        if checked:
-            self.setStyleSheet("""
-                QPushButton {
-                    background: #3b82f6; border: 2px solid #3b82f6; color: white;
-                    border-radius: 12px; padding: 8px; font-weight: 600; font-size: 11px;
-                }
-                QPushButton:hover { background: #2563eb; }
-            """)
-        else:
-            self.setStyleSheet("""
-                QPushButton {
-                    background: #1a1f1a; border: 1px solid #2d3d2d; color: #64748b;
-                    border-radius: 12px; padding: 8px; font-weight: 500; font-size: 11px;
-                }
-                QPushButton:hover { background: #1f2a1f; border-color: #3d4d3d; }
-            """)
+        self.setObjectName("effect_btn")
 
 
 # ═════════════════════════════════════════════════════════════════════════
@@ -292,29 +677,84 @@ class EffectButton(QPushButton):
 # ═════════════════════════════════════════════════════════════════════════
 
 class ControlPanel(QMainWindow):
+    _tray_icon_cache: Optional[QIcon] = None
+
     def __init__(self):
         super().__init__()
-        self.settings = Settings()
+        self.settings = Settings(self)
         self.setWindowTitle("BluCast")
         self.setMinimumSize(480, 780)
         self.resize(500, 880)
         self.supported_formats: Dict[str, List[int]] = {}
 
+        self._pending: Dict[str, object] = {}
+        self._last_sent: Dict[str, object] = {}  # Last value written per key
+        self._scan_worker: Optional[DeviceScanWorker] = None
+        self._fmt_request = 0
+        self._fmt_jobs: Dict[int, FormatScanWorker] = {}
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(50)
+        self._flush_timer.timeout.connect(self._flush_commands)
+
         self._build_ui()
         self._setup_tray()
         self._apply_saved_settings()
-        self._start_preview_timer()
-
-    # ── Preview timer ────────────────────────────────────────────────────
-    def _start_preview_timer(self):
+        self._start_preview_watch()
+
+    # ── Preview watch ────────────────────────────────────────────────────
+    def _start_preview_watch(self):
+        self._preview_sig: Tuple[int, int, int] = (0, 0, 0)
+        self._last_preview_size: Tuple[int, int] = (0, 0)
+        self._preview_shm = PreviewShm()
+        self._preview_job: Optional[PreviewDecoder] = None
+        self._last_shm_frame = 0.0
+        # The server renames each JPEG frame into place, which drops a watch
+        # on the file itself, so watch the directory instead.
+        self._preview_watcher = QFileSystemWatcher(self)
+        self._preview_watcher.directoryChanged.connect(self._update_preview)
+        # Safety tick: arms the watch once the server creates the directory
+        # and catches anything the watcher missed. Raw shared-memory frames
+        # raise no file events, so it runs at frame rate while they arrive.
         self.preview_timer = QTimer(self)
-        self.preview_timer.timeout.connect(self._update_preview)
-        self.preview_timer.start(33)  # ~30 fps
+        self.preview_timer.timeout.connect(self._watch_preview)
+        self.preview_timer.start(500)
+        self._watch_preview()
+
+    def _watch_preview(self):
+        preview_dir = os.path.dirname(PREVIEW_FILE)
+        if not self._preview_watcher.directories() and os.path.isdir(preview_dir):
+            self._preview_watcher.addPath(preview_dir)
+        self._update_preview()
+        # Back off once the server stops publishing (window hidden, camera
+        # idle); the first new frame brings the tick back to frame rate.
+        streaming = time.monotonic() - self._last_shm_frame < 1.0
+        interval = 33 if self._preview_shm.mapped and streaming else 500
+        if self.preview_timer.interval() != interval:
+            self.preview_timer.setInterval(interval)
 
     def _update_preview(self):
-        """Read JPEG preview written by the server."""
-        path = Path(PREVIEW_FILE)
-        if not path.exists():
+        """Show the newest frame from the server.
+
+        Raw frames from shared memory skip JPEG decoding entirely; the JPEG
+        file is only read when the server could not create the segment.
+        """
+        shm = self._preview_shm
+        # A fresh frame proves the mapping is current, so the segment is
+        # only stat'ed (to catch a replaced one) when nothing new arrived.
+        scaled = shm.read(self._scale_preview)
+        if scaled is None and shm.is_open():
+            scaled = shm.read(self._scale_preview)
+        if scaled is not None:
+            self._last_shm_frame = time.monotonic()
+            self._set_preview(scaled)
+            return
+        if shm.mapped:
+            return
+
+        try:
+            st = os.stat(PREVIEW_FILE)
+        except OSError:
             if self.preview_label.pixmap() and not self.preview_label.pixmap().isNull():
                 pass  # Keep last good frame
             else:
@@ -322,48 +762,83 @@ class ControlPanel(QMainWindow):
                 self.preview_label.hide()
             return
 
-        try:
-            pixmap = QPixmap(str(path))
-            if pixmap.isNull():
-                return
-            scaled = pixmap.scaled(
-                self.preview_label.width() - 4,
-                self.preview_label.height() - 4,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation,
-            )
-            self.preview_label.setPixmap(scaled)
-            self.preview_placeholder.hide()
-            self.preview_label.show()
-        except Exception:
-            pass
+        # The server renames a fresh file into place per frame, so an
+        # unchanged signature means there is nothing new to decode.
+        sig = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if sig == self._preview_sig:
+            return
+
+        # Decoding is the expensive part, so it runs on the thread pool;
+        # frames arriving while one is in flight are dropped.
+        if self._preview_job is not None:
+            return
+        self._preview_job = PreviewDecoder(sig, *self._preview_scaling())
+        self._preview_job.done.connect(self._on_preview_decoded)
+        QThreadPool.globalInstance().start(self._preview_job)
+
+    def _on_preview_decoded(self, img: QImage, sig: tuple):
+        self._preview_job = None
+        if img.isNull():
+            return
+        self._set_preview(img)
+        self._preview_sig = sig
+
+    def _preview_scaling(self) -> Tuple[Tuple[int, int], Qt.TransformationMode]:
+        # Smooth scaling only when the label was resized; steady-state
+        # frames take the fast path.
+        target = (self.preview_label.width() - 4, self.preview_label.height() - 4)
+        mode = Qt.FastTransformation
+        if target != self._last_preview_size:
+            mode = Qt.SmoothTransformation
+            self._last_preview_size = target
+        return target, mode
+
+    def _scale_preview(self, img: QImage) -> QImage:
+        target, mode = self._preview_scaling()
+        return img.scaled(*target, Qt.KeepAspectRatio, mode)
+
+    def _set_preview(self, scaled: QImage):
+        self.preview_label.setPixmap(QPixmap.fromImage(scaled))
+        self.preview_placeholder.hide()
+        self.preview_label.show()
 
     # ── System tray ──────────────────────────────────────────────────────
-    def _make_tray_icon(self) -> QIcon:
-        px = QPixmap(64, 64)
-        px.fill(Qt.transparent)
-        if Path(LOGO_PATH).exists():
-            renderer = QSvgRenderer(LOGO_PATH)
-            painter = QPainter(px)
-            renderer.render(painter)
-            painter.end()
-        else:
-            painter = QPainter(px)
+    @classmethod
+    def _make_tray_icon(cls) -> QIcon:
+        """Build the tray icon once per process and reuse it."""
+        if cls._tray_icon_cache is not None:
+            return cls._tray_icon_cache
+        if HAS_LOGO:
+            # Qt's SVG icon engine renders the logo at whatever size the
+            # panel asks for, so HiDPI trays never rescale a bitmap.
+            cls._tray_icon_cache = QIcon(LOGO_PATH)
+            return cls._tray_icon_cache
+        icon = QIcon()
+        # No logo: paint the fallback once per common tray size instead
+        for size in TRAY_ICON_SIZES:
+            # Paint into the premultiplied format the compositor blends natively
+            img = QImage(size, size, QImage.Format_ARGB32_Premultiplied)
+            img.fill(Qt.transparent)
+            painter = QPainter(img)
             painter.setRenderHint(QPainter.Antialiasing)
+            painter.scale(size / 64, size / 64)
             painter.setBrush(QColor(59, 130, 246))
             painter.setPen(Qt.NoPen)
             painter.drawEllipse(4, 4, 56, 56)
             painter.setBrush(QColor(255, 255, 255))
             painter.drawEllipse(20, 20, 24, 24)
             painter.end()
-        return QIcon(px)
+            icon.addPixmap(QPixmap.fromImage(img))
+        cls._tray_icon_cache = icon
+        return cls._tray_icon_cache
 
     def _setup_tray(self):
-        self.tray_icon = QSystemTrayIcon(self)
+        self.tray_icon: Optional[QSystemTrayIcon] = None
         self.tray_available = QSystemTrayIcon.isSystemTrayAvailable()
         if not self.tray_available:
             return
 
+        self.tray_icon = QSystemTrayIcon(self)
         self.tray_icon.setIcon(self._make_tray_icon())
         self.tray_icon.setToolTip("BluCast")
 
@@ -395,6 +870,7 @@ class ControlPanel(QMainWindow):
                 self._show_window()
 
     def closeEvent(self, event):
+        self.settings.flush()
         if self.tray_available and self.tray_icon.isVisible():
             self.hide()
             send_command("WINDOW:hidden")
@@ -424,7 +900,7 @@ class ControlPanel(QMainWindow):
 
         self.preview_container = QWidget()
         self.preview_container.setMinimumHeight(200)
-        self.preview_container.setStyleSheet("background: #0d120d; border-radius: 12px;")
+        self.preview_container.setObjectName("preview_box")
         inner = QVBoxLayout(self.preview_container)
         inner.setContentsMargins(0, 0, 0, 0)
 
@@ -432,7 +908,7 @@ class ControlPanel(QMainWindow):
         ph_layout = QVBoxLayout(self.preview_placeholder)
         ph_layout.setAlignment(Qt.AlignCenter)
         ph_label = QLabel("Camera preview")
-        ph_label.setStyleSheet("color: #64748b; font-size: 13px; background: transparent;")
+        ph_label.setObjectName("placeholder")
         ph_label.setAlignment(Qt.AlignCenter)
         ph_layout.addWidget(ph_label)
         inner.addWidget(self.preview_placeholder)
@@ -446,7 +922,7 @@ class ControlPanel(QMainWindow):
         pv_layout.addWidget(self.preview_container)
 
         self.preview_info = QLabel("1280x720 @ 30fps")
-        self.preview_info.setStyleSheet("color: #64748b; font-size: 11px; background: transparent; padding: 4px;")
+        self.preview_info.setObjectName("preview_info")
         self.preview_info.setAlignment(Qt.AlignRight)
         pv_layout.addWidget(self.preview_info)
         layout.addWidget(preview_card)
@@ -459,16 +935,16 @@ class ControlPanel(QMainWindow):
         status_info = QVBoxLayout()
         status_info.setSpacing(2)
         status_title = QLabel("Virtual Camera")
-        status_title.setStyleSheet("font-size: 14px; font-weight: 600; color: #fff; background: transparent;")
+        status_title.setObjectName("section_title")
         status_info.addWidget(status_title)
         self.status_label = QLabel(VCAM_DEVICE)
-        self.status_label.setStyleSheet("font-size: 12px; color: #64748b; background: transparent;")
+        self.status_label.setObjectName("status_label")
         status_info.addWidget(self.status_label)
         status_layout.addLayout(status_info)
         status_layout.addStretch()
 
         self.status_dot = QLabel("●")
-        self.status_dot.setStyleSheet("color: #22c55e; font-size: 22px; background: transparent;")
+        self.status_dot.setObjectName("status_dot")
         status_layout.addWidget(self.status_dot)
         layout.addWidget(status_card)
 
@@ -479,7 +955,7 @@ class ControlPanel(QMainWindow):
         fx_layout.setSpacing(16)
 
         fx_title = QLabel("Background Effects")
-        fx_title.setStyleSheet("font-size: 14px; font-weight: 600; color: #fff; background: transparent;")
+        fx_title.setObjectName("section_title")
         fx_layout.addWidget(fx_title)
 
         btn_row = QHBoxLayout()
@@ -488,13 +964,13 @@ class ControlPanel(QMainWindow):
         self.effect_group = QButtonGroup(self)
         self.effect_group.setExclusive(True)
 
-        for key, label in [("blur", "BLUR"), ("replace", "REPLACE"),
-                           ("remove", "REMOVE"), ("none", "NONE")]:
+        for key, label in EFFECT_BUTTONS:
             btn = EffectButton(label)
+            btn.setProperty("effect_key", key)
             self.effect_buttons[key] = btn
             self.effect_group.addButton(btn)
             btn_row.addWidget(btn)
-            btn.toggled.connect(lambda checked, k=key: self._on_effect(k, checked))
+        self.effect_group.buttonToggled.connect(self._on_effect_toggled)
         fx_layout.addLayout(btn_row)
 
         # Blur controls
@@ -506,7 +982,7 @@ class ControlPanel(QMainWindow):
         bh = QHBoxLayout()
         bh.addWidget(self._styled_label("Blur Strength"))
         self.blur_value_label = QLabel("50%")
-        self.blur_value_label.setStyleSheet("color: #3b82f6; font-size: 13px; font-weight: 600; background: transparent;")
+        self.blur_value_label.setObjectName("blur_value")
         bh.addWidget(self.blur_value_label)
         bl_layout.addLayout(bh)
 
@@ -514,7 +990,10 @@ class ControlPanel(QMainWindow):
         self.blur_slider.setRange(0, 100)
         self.blur_slider.setValue(50)
         self.blur_slider.valueChanged.connect(self._on_blur)
+        # Drags are coalesced by _commit; send the final value on release
+        self.blur_slider.sliderReleased.connect(self._flush_commands)
         bl_layout.addWidget(self.blur_slider)
+
         fx_layout.addWidget(self.blur_controls)
         self.blur_controls.hide()
 
@@ -527,14 +1006,10 @@ class ControlPanel(QMainWindow):
 
         bg_row = QHBoxLayout()
         self.bg_path_label = QLabel("No image selected")
-        self.bg_path_label.setStyleSheet("color: #64748b; font-size: 12px; background: transparent;")
+        self.bg_path_label.setObjectName("bg_path")
         bg_row.addWidget(self.bg_path_label, 1)
         self.bg_button = QPushButton("Browse")
-        self.bg_button.setStyleSheet("""
-            QPushButton { background: #3b82f6; border: none; color: white;
-                          border-radius: 8px; padding: 8px 16px; font-weight: 500; }
-            QPushButton:hover { background: #2563eb; }
-        """)
+        self.bg_button.setObjectName("bg_browse")
         self.bg_button.clicked.connect(self._on_browse_bg)
         bg_row.addWidget(self.bg_button)
         bg_layout.addLayout(bg_row)
@@ -550,26 +1025,20 @@ class ControlPanel(QMainWindow):
         cam_layout.setSpacing(14)
 
         cam_title = QLabel("Camera Settings")
-        cam_title.setStyleSheet("font-size: 14px; font-weight: 600; color: #fff; background: transparent;")
+        cam_title.setObjectName("section_title")
         cam_layout.addWidget(cam_title)
 
         cam_layout.addWidget(self._styled_label("Input Device"))
         dev_row = QHBoxLayout()
         self.device_combo = QComboBox()
-        self.device_combo.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.device_combo.setSizePolicy(SP_EXPAND_FIXED)
         self._populate_devices()
         self.device_combo.currentIndexChanged.connect(self._on_device)
         dev_row.addWidget(self.device_combo)
 
-        refresh_btn = QPushButton("⟳")
+        self.refresh_btn = refresh_btn = QPushButton("⟳")
         refresh_btn.setFixedSize(46, 46)
-        refresh_btn.setStyleSheet("""
-            QPushButton {
-                background: #1a1f1a; border: 1px solid #2d3d2d; border-radius: 10px;
-                font-size: 18px; color: #94a3b8; padding: 8px;
-            }
-            QPushButton:hover { background: #1f2a1f; border-color: #3b82f6; color: #3b82f6; }
-        """)
+        refresh_btn.setObjectName("refresh_btn")
         refresh_btn.clicked.connect(self._refresh_devices)
         dev_row.addWidget(refresh_btn)
         cam_layout.addLayout(dev_row)
@@ -589,40 +1058,69 @@ class ControlPanel(QMainWindow):
 
         # ── Quit ──
         quit_btn = QPushButton("Quit")
-        quit_btn.setStyleSheet("""
-            QPushButton {
-                background: #1a1515; border: 1px solid #3d2d2d; color: #ef4444;
-                border-radius: 10px; padding: 14px; font-size: 14px; font-weight: 600;
-            }
-            QPushButton:hover { background: #2d1f1f; border-color: #4d3d3d; }
-        """)
+        quit_btn.setObjectName("quit_btn")
         quit_btn.clicked.connect(self._quit)
         layout.addWidget(quit_btn)
 
     # ── Helpers ──────────────────────────────────────────────────────────
     def _styled_label(self, text: str) -> QLabel:
         lbl = QLabel(text)
-        lbl.setStyleSheet("color: #94a3b8; font-size: 12px; background: transparent;")
+        lbl.setObjectName("field_label")
         return lbl
 
-    def _populate_devices(self):
-        self.device_combo.blockSignals(True)
-        self.device_combo.clear()
-        for path, name in get_video_devices():
-            self.device_combo.addItem(f"{name}  ({path})", path)
-        self.device_combo.blockSignals(False)
+    @staticmethod
+    def _fill_combo(combo: QComboBox, items: List[Tuple[str, object]]):
+        """Replace the combo's items unless it already holds exactly these."""
+        if [(combo.itemText(i), combo.itemData(i)) for i in range(combo.count())] == items:
+            return
+        with QSignalBlocker(combo):
+            combo.clear()
+            for text, data in items:
+                combo.addItem(text, data)
+
+    def _populate_devices(self, devices: Optional[List[Tuple[str, str]]] = None):
+        """Bring the device combo in line with the probed devices.
+
+        Only the differences are applied, so a refresh keeps the current
+        selection and doesn't reset the combo's model.
+        """
+        if devices is None:
+            devices = get_video_devices()
+        combo = self.device_combo
+        wanted = dict(devices)
+        with QSignalBlocker(combo):
+            for i in reversed(range(combo.count())):
+                if combo.itemData(i) not in wanted:
+                    combo.removeItem(i)
+            # Both lists are sorted by path, so survivors are already in order
+            for i, (path, name) in enumerate(devices):
+                text = f"{name}  ({path})"
+                if i < combo.count() and combo.itemData(i) == path:
+                    if combo.itemText(i) != text:
+                        combo.setItemText(i, text)
+                else:
+                    combo.insertItem(i, text, path)
 
     def _refresh_devices(self):
-        cur = self.device_combo.currentData()
-        self._populate_devices()
-        for i in range(self.device_combo.count()):
-            if self.device_combo.itemData(i) == cur:
-                self.device_combo.setCurrentIndex(i)
-                break
+        if self._scan_worker is not None:
+            return
+        invalidate_device_cache()
+        self.refresh_btn.setEnabled(False)
+        self.refresh_btn.setText("…")
+        self._scan_worker = DeviceScanWorker()
+        self._scan_worker.finished.connect(self._on_devices_ready)
+        QThreadPool.globalInstance().start(self._scan_worker)
+
+    def _on_devices_ready(self, devices: list):
+        self._scan_worker = None
+        self.refresh_btn.setText("⟳")
+        self.refresh_btn.setEnabled(True)
+
+        self._populate_devices(devices)
 
     def _refresh_formats(self):
         device = self.settings.get("input_device")
-        if not device or not Path(device).exists():
+        if not device or not os.path.exists(device):
             devs = get_video_devices()
             device = devs[0][0] if devs else "/dev/video0"
             self.settings.set("input_device", device)
@@ -632,13 +1130,8 @@ class ControlPanel(QMainWindow):
     def _populate_res_combo(self, preferred: Optional[str] = None) -> Optional[str]:
         if not self.supported_formats:
             return None
-        resolutions = sorted(self.supported_formats.keys(),
-                             key=lambda r: tuple(map(int, r.split("x"))))
-        self.res_combo.blockSignals(True)
-        self.res_combo.clear()
-        for r in resolutions:
-            self.res_combo.addItem(r, r)
-        self.res_combo.blockSignals(False)
+        resolutions = sorted(self.supported_formats.keys(), key=_parse_res)
+        self._fill_combo(self.res_combo, [(r, r) for r in resolutions])
         target = preferred if preferred in self.supported_formats else resolutions[0]
         idx = self.res_combo.findData(target)
         if idx >= 0:
@@ -647,16 +1140,9 @@ class ControlPanel(QMainWindow):
 
     def _populate_fps_combo(self, res: str, preferred: Optional[int] = None) -> Optional[int]:
         fps_list = self.supported_formats.get(res, [])
+        self._fill_combo(self.fps_combo, [(f"{f} fps", f) for f in fps_list])
         if not fps_list:
-            self.fps_combo.blockSignals(True)
-            self.fps_combo.clear()
-            self.fps_combo.blockSignals(False)
             return None
-        self.fps_combo.blockSignals(True)
-        self.fps_combo.clear()
-        for f in fps_list:
-            self.fps_combo.addItem(f"{f} fps", f)
-        self.fps_combo.blockSignals(False)
         target = preferred if preferred in fps_list else fps_list[0]
         idx = self.fps_combo.findData(target)
         if idx >= 0:
@@ -670,34 +1156,46 @@ class ControlPanel(QMainWindow):
 
     # ── Apply saved settings ─────────────────────────────────────────────
     def _apply_saved_settings(self):
+        # Widgets are updated with their signals blocked so the callbacks
+        # don't echo every restored value to the server; _send_all() below
+        # pushes the full state once.
+
         # Effect
         eff = self.settings.get("effect_mode")
-        btn = self.effect_buttons.get(eff, self.effect_buttons["blur"])
-        btn.setChecked(True)
+        if eff not in self.effect_buttons:
+            eff = "blur"
+        btn = self.effect_buttons[eff]
+        with QSignalBlocker(self.effect_group):
+            btn.setChecked(True)
+        self._show_effect_controls(eff)
 
         # Blur
-        self.blur_slider.setValue(self.settings.get("blur_strength"))
+        blur = self.settings.get("blur_strength")
+        with QSignalBlocker(self.blur_slider):
+            self.blur_slider.setValue(blur)
+        self.blur_value_label.setText(f"{blur}%")
 
         # Background
         bg = self.settings.get("background_image")
-        if bg and Path(bg).exists():
-            self.bg_path_label.setText(Path(bg).name)
-            self.bg_path_label.setStyleSheet("color: #e2e8f0; font-size: 12px; background: transparent;")
+        self._bg_valid = bool(bg) and os.path.exists(bg)
+        if self._bg_valid:
+            self._show_bg_name(bg)
 
         # Device
         saved_dev = self.settings.get("input_device")
-        if saved_dev:
-            for i in range(self.device_combo.count()):
-                if self.device_combo.itemData(i) == saved_dev:
-                    self.device_combo.setCurrentIndex(i)
-                    break
+        idx = self.device_combo.findData(saved_dev) if saved_dev else -1
+        if idx >= 0:
+            with QSignalBlocker(self.device_combo):
+                self.device_combo.setCurrentIndex(idx)
 
         # Resolution / FPS
         self._refresh_formats()
-        sel_res = self._populate_res_combo(self.settings.get("resolution"))
-        sel_fps = None
+        with QSignalBlocker(self.res_combo), QSignalBlocker(self.fps_combo):
+            sel_res = self._populate_res_combo(self.settings.get("resolution"))
+            sel_fps = None
+            if sel_res:
+                sel_fps = self._populate_fps_combo(sel_res, self.settings.get("fps"))
         if sel_res:
-            sel_fps = self._populate_fps_combo(sel_res, self.settings.get("fps"))
             self.settings.set("resolution", sel_res)
         if sel_fps is not None:
             self.settings.set("fps", sel_fps)
@@ -707,63 +1205,117 @@ class ControlPanel(QMainWindow):
         self._send_all()
 
     def _send_all(self):
-        eff = self.settings.get("effect_mode")
-        send_command(f"MODE:{EFFECT_MAP.get(eff, 6)}")
+        sent = {}
+        for key in SETTING_COMMANDS:
+            value = self.settings.get(key)
+            if value == "":
+                continue  # No device / background chosen yet
+            if key == "background_image" and not self._bg_valid:
+                continue  # Checked once while restoring
+            sent[key] = value
+        cmds = [SETTING_COMMANDS[k](v) for k, v in sent.items()]
+        cmds.append("WINDOW:visible")
+        if send_commands(cmds):
+            self._last_sent.update(sent)
+
+    def _commit(self, key: str, value):
+        """Store a setting and queue its command for the server.
+
+        Rapid updates to the same key (slider drags, combo scrolling) are
+        coalesced so only the latest value is written.
+        """
+        self.settings.set(key, value)
+        if key in DEDUP_SETTINGS and self._last_sent.get(key) == value:
+            # Swept back to what the server already has
+            self._pending.pop(key, None)
+            return
+        self._pending[key] = value
+        self._flush_timer.start()
 
-        dev = self.settings.get("input_device")
-        if dev:
-            send_command(f"DEVICE:{dev}")
+    def _flush_commands(self):
+        self._flush_timer.stop()
+        if self._pending:
+            # Format only the surviving values, once per flush
+            if send_commands([SETTING_COMMANDS[k](v) for k, v in self._pending.items()]):
+                self._last_sent.update(self._pending)
+            self._pending.clear()
 
-        bg = self.settings.get("background_image")
-        if bg and Path(bg).exists():
-            send_command(f"BG:{bg}")
+    # ── Callbacks ────────────────────────────────────────────────────────
+    def _show_effect_controls(self, key: str):
+        self.blur_controls.setVisible(key == "blur")
+        self.bg_controls.setVisible(key == "replace")
 
-        send_command(f"BLUR:{self.settings.get('blur_strength') / 100.0}")
-        send_command(f"RESOLUTION:{self.settings.get('resolution')}")
-        send_command(f"FPS:{self.settings.get('fps')}")
-        send_command("WINDOW:visible")
+    def _on_effect_toggled(self, btn: QPushButton, checked: bool):
+        self._on_effect(btn.property("effect_key"), checked)
 
-    # ── Callbacks ────────────────────────────────────────────────────────
     def _on_effect(self, key: str, checked: bool):
         if not checked:
             return
-        self.blur_controls.setVisible(key == "blur")
-        self.bg_controls.setVisible(key == "replace")
-        send_command(f"MODE:{EFFECT_MAP.get(key, 6)}")
-        self.settings.set("effect_mode", key)
+        self._show_effect_controls(key)
+        self._commit("effect_mode", key)
 
     def _on_blur(self, value: int):
         self.blur_value_label.setText(f"{value}%")
-        send_command(f"BLUR:{value / 100.0}")
-        self.settings.set("blur_strength", value)
+        self._commit("blur_strength", value)
+
+    def _show_bg_name(self, path: str):
+        self.bg_path_label.setText(os.path.basename(path))
+        # The [selected] rule in STYLESHEET only applies after a re-polish
+        self.bg_path_label.setProperty("selected", True)
+        self.bg_path_label.style().polish(self.bg_path_label)
 
     def _on_browse_bg(self):
-        start = "/host_home" if Path("/host_home").exists() else ""
+        start = HOST_HOME if HAS_HOST_HOME else ""
         path, _ = QFileDialog.getOpenFileName(
             self, "Select Background Image", start,
             "Images (*.png *.jpg *.jpeg *.bmp *.webp)",
         )
         if path:
-            self.bg_path_label.setText(Path(path).name)
-            self.bg_path_label.setStyleSheet("color: #e2e8f0; font-size: 12px; background: transparent;")
-            send_command(f"BG:{path}")
-            self.settings.set("background_image", path)
+            self._bg_valid = True
+            self._show_bg_name(path)
+            self._commit("background_image", path)
 
     def _on_device(self, index: int):
         if index < 0:
             return
         device = self.device_combo.itemData(index)
-        send_command(f"DEVICE:{device}")
+        # Saved now, but sent together with the new formats so the server
+        # reopens the camera once.
         self.settings.set("input_device", device)
-        self._refresh_formats()
-        sel_res = self._populate_res_combo(self.settings.get("resolution"))
+        # Replies are matched on the request id, so a slow probe for a
+        # device the user already moved away from is ignored.
+        self._fmt_request += 1
+        fmts = cached_supported_formats(device)
+        if fmts is not None:
+            self._apply_device_formats(device, fmts)
+            return
+        self.res_combo.setEnabled(False)
+        self.fps_combo.setEnabled(False)
+        worker = FormatScanWorker(self._fmt_request, device)
+        worker.finished.connect(partial(self._on_formats_ready, device))
+        self._fmt_jobs[worker.request] = worker
+        QThreadPool.globalInstance().start(worker)
+
+    def _on_formats_ready(self, device: str, request: int, fmts: dict):
+        self._fmt_jobs.pop(request, None)
+        if request != self._fmt_request:
+            return
+        self._apply_device_formats(device, fmts)
+
+    def _apply_device_formats(self, device: str, fmts: Dict[str, List[int]]):
+        self._commit("input_device", device)
+        self.res_combo.setEnabled(True)
+        self.fps_combo.setEnabled(True)
+        self.supported_formats = fmts if fmts else DEFAULT_FORMATS.copy()
+        # Repopulate silently; otherwise selecting the new resolution would
+        # re-enter _on_resolution and _on_fps for values committed below.
+        with QSignalBlocker(self.res_combo), QSignalBlocker(self.fps_combo):
+            sel_res = self._populate_res_combo(self.settings.get("resolution"))
+            sel_fps = self._populate_fps_combo(sel_res, self.settings.get("fps")) if sel_res else None
         if sel_res:
-            sel_fps = self._populate_fps_combo(sel_res, self.settings.get("fps"))
-            self.settings.set("resolution", sel_res)
-            send_command(f"RESOLUTION:{sel_res}")
+            self._commit("resolution", sel_res)
             if sel_fps is not None:
-                self.settings.set("fps", sel_fps)
-                send_command(f"FPS:{sel_fps}")
+                self._commit("fps", sel_fps)
         self._update_info_label()
 
     def _on_resolution(self, index: int):
@@ -771,24 +1323,26 @@ class ControlPanel(QMainWindow):
         if not res:
             return
         prev_fps = self.settings.get("fps")
-        self.settings.set("resolution", res)
+        self._commit("resolution", res)
         sel_fps = self._populate_fps_combo(res, prev_fps)
-        send_command(f"RESOLUTION:{res}")
         if sel_fps is not None and sel_fps != prev_fps:
-            self.settings.set("fps", sel_fps)
-            send_command(f"FPS:{sel_fps}")
+            self._commit("fps", sel_fps)
         self._update_info_label()
 
     def _on_fps(self, index: int):
         fps = self.fps_combo.itemData(index)
         if fps is None:
             return
-        send_command(f"FPS:{fps}")
-        self.settings.set("fps", fps)
+        self._commit("fps", fps)
         self._update_info_label()
 
     def _quit(self):
+        self.settings.flush()
+        self._flush_commands()
         send_command("QUIT")
+        # Drop probes/decodes that haven't started; the pool waits for
+        # running ones on exit, and those are bounded by v4l2-ctl timeouts.
+        QThreadPool.globalInstance().clear()
         QApplication.quit()
 
 
@@ -800,21 +1354,21 @@ def main():
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)
     app.setStyle("Fusion")
-    app.setStyleSheet(STYLESHEET)
 
+    # Palette first, stylesheet last, so style caches are only built once.
+    # Text colours come from the stylesheet's QWidget rule; the remaining
+    # roles style dialogs and menus that the stylesheet doesn't cover.
     palette = QPalette()
     palette.setColor(QPalette.Window,          QColor("#0a0f0a"))
-    palette.setColor(QPalette.WindowText,      QColor("#e2e8f0"))
     palette.setColor(QPalette.Base,            QColor("#111611"))
     palette.setColor(QPalette.AlternateBase,   QColor("#1a1f1a"))
-    palette.setColor(QPalette.Text,            QColor("#e2e8f0"))
     palette.setColor(QPalette.Button,          QColor("#1a1f1a"))
-    palette.setColor(QPalette.ButtonText,      QColor("#94a3b8"))
     palette.setColor(QPalette.Highlight,       QColor("#3b82f6"))
     palette.setColor(QPalette.HighlightedText, QColor("#ffffff"))
     app.setPalette(palette)
+    app.setStyleSheet(STYLESHEET)
 
-    if Path(LOGO_PATH).exists():
+    if HAS_LOGO:
         app.setWindowIcon(QIcon(LOGO_PATH))
 
     window = ControlPanel()
@@ -6,11 +6,13 @@
 #include <stdlib.h>
 #include <string.h>
 #include <sys/ioctl.h>
+#include <sys/mman.h>
 #include <sys/stat.h>
 #include <unistd.h>
 
 #include <atomic>
 #include <chrono>
+#include <condition_variable>
 #include <iostream>
 #include <mutex>
 #include <string>
@@ -27,6 +29,7 @@ static const char *CMD_PIPE_PATH   = "/tmp/blucast/cmd.pipe";
 static const char *CONSUMERS_FILE  = "/tmp/blucast/consumers";
 static const char *PREVIEW_FILE    = "/tmp/blucast/preview.jpg";
 static const char *PREVIEW_TMP     = "/tmp/blucast/preview.jpg.tmp";
+static const char *PREVIEW_SHM     = "/blucast-preview";  // /dev/shm/blucast-preview
 static const char *PID_FILE        = "/tmp/blucast/server.pid";
 static const char *VCAM_DEVICE     = "/dev/video10";
 
@@ -48,6 +51,26 @@ static std::mutex  g_bgMutex;
 static std::string g_bgFile;
 static bool        g_bgChanged = false;
 
+// Lets the main loop's idle/retry waits end as soon as a command arrives
+static std::mutex              g_wakeMutex;
+static std::condition_variable g_wakeCv;
+static unsigned                g_wakeSeq = 0;
+
+static void wakeMainLoop() {
+    {
+        std::lock_guard<std::mutex> lock(g_wakeMutex);
+        g_wakeSeq++;
+    }
+    g_wakeCv.notify_all();
+}
+
+// Sleep for up to `timeout`, returning early on the next command
+static void waitForCommand(std::chrono::milliseconds timeout) {
+    std::unique_lock<std::mutex> lock(g_wakeMutex);
+    unsigned seq = g_wakeSeq;
+    g_wakeCv.wait_for(lock, timeout, [seq] { return g_wakeSeq != seq || !g_running; });
+}
+
 //  Effect modes ────────────────────────────────────────────────────────
 enum EffectMode {
     MODE_MATTE    = 0,
@@ -137,15 +160,15 @@ public:
 
     void writeFrame(const cv::Mat &bgr) {
         if (fd_ < 0) return;
-        cv::Mat yuv;
+        // yuv_ / resized_ keep their allocation between frames; OpenCV only
+        // reallocates when the output size changes.
         if (bgr.cols != width_ || bgr.rows != height_) {
-            cv::Mat resized;
-            cv::resize(bgr, resized, cv::Size(width_, height_));
-            cv::cvtColor(resized, yuv, cv::COLOR_BGR2YUV_I420);
+            cv::resize(bgr, resized_, cv::Size(width_, height_));
+            cv::cvtColor(resized_, yuv_, cv::COLOR_BGR2YUV_I420);
         } else {
-            cv::cvtColor(bgr, yuv, cv::COLOR_BGR2YUV_I420);
+            cv::cvtColor(bgr, yuv_, cv::COLOR_BGR2YUV_I420);
         }
-        ::write(fd_, yuv.data, yuv.total() * yuv.elemSize());
+        ::write(fd_, yuv_.data, yuv_.total() * yuv_.elemSize());
     }
 
     void writeIdleFrame() {
@@ -171,6 +194,7 @@ public:
 
 private:
     int fd_, width_, height_;
+    cv::Mat yuv_, resized_;
     cv::Mat idleYuv_;
     int idleW_ = 0, idleH_ = 0;
 };
@@ -191,6 +215,87 @@ static void writePreviewJpeg(const cv::Mat &bgr) {
     }
 }
 
+// Raw BGR preview in POSIX shared memory, so the control panel can skip the
+// JPEG encode/decode round trip. Layout: a 32-byte header followed by
+// height * stride bytes of pixels. seq is odd while a frame is being written
+// and even once it is complete; readers discard copies that straddle a change.
+struct PreviewHeader {
+    char     magic[4];  // "BCPV"
+    uint32_t seq;
+    uint32_t width;
+    uint32_t height;
+    uint32_t stride;
+    uint32_t reserved[3];
+};
+
+class PreviewShm {
+public:
+    ~PreviewShm() { close(); }
+
+    bool write(const cv::Mat &bgr) {
+        if (bgr.type() != CV_8UC3) return false;
+        if (!map_ || bgr.cols != width_ || bgr.rows != height_) {
+            if (!create(bgr.cols, bgr.rows)) return false;
+        }
+        auto *hdr = static_cast<PreviewHeader *>(map_);
+        uint32_t seq = hdr->seq;
+        __atomic_store_n(&hdr->seq, seq + 1, __ATOMIC_RELAXED);
+        __atomic_thread_fence(__ATOMIC_RELEASE);
+        uint8_t *dst = static_cast<uint8_t *>(map_) + sizeof(PreviewHeader);
+        size_t rowBytes = (size_t)width_ * 3;
+        if (bgr.isContinuous()) {
+            memcpy(dst, bgr.data, rowBytes * height_);
+        } else {
+            for (int y = 0; y < height_; y++)
+                memcpy(dst + y * rowBytes, bgr.ptr(y), rowBytes);
+        }
+        __atomic_store_n(&hdr->seq, seq + 2, __ATOMIC_RELEASE);
+        return true;
+    }
+
+    void close() {
+        if (map_) {
+            munmap(map_, size_);
+            map_ = nullptr;
+            shm_unlink(PREVIEW_SHM);
+        }
+        width_ = height_ = 0;
+    }
+
+private:
+    bool create(int w, int h) {
+        // A fresh segment per size: readers still mapping the old one keep a
+        // valid (unlinked) mapping instead of faulting on a shrunk file.
+        close();
+        shm_unlink(PREVIEW_SHM);
+        int fd = shm_open(PREVIEW_SHM, O_CREAT | O_RDWR, 0644);
+        if (fd < 0) return false;
+        size_t size = sizeof(PreviewHeader) + (size_t)w * h * 3;
+        void *map = MAP_FAILED;
+        if (ftruncate(fd, size) == 0)
+            map = mmap(nullptr, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        ::close(fd);
+        if (map == MAP_FAILED) {
+            shm_unlink(PREVIEW_SHM);
+            return false;
+        }
+        map_ = map;
+        size_ = size;
+        width_ = w;
+        height_ = h;
+        auto *hdr = static_cast<PreviewHeader *>(map_);
+        hdr->width = w;
+        hdr->height = h;
+        hdr->stride = w * 3;
+        memcpy(hdr->magic, "BCPV", 4);
+        return true;
+    }
+
+    void  *map_ = nullptr;
+    size_t size_ = 0;
+    int    width_ = 0, height_ = 0;
+};
+
 // ══════════════════════════════════════════════════════════════════════════
 // VideoFX Processor
 // ══════════════════════════════════════════════════════════════════════════
@@ -271,6 +376,17 @@ public:
             sizeof(NvVFX_StateObjectHandle) * modelBatch);
         batchOfStates_[0] = stateArray_[0];
 
+        // The GPU buffers only change here, so bind them once instead of on
+        // every frame. Loading the blur effect sizes its internal buffers.
+        NvVFX_SetImage(eff_, NVVFX_INPUT_IMAGE,  &srcGPU_);
+        NvVFX_SetImage(eff_, NVVFX_OUTPUT_IMAGE, &dstGPU_);
+        if (bgblurEff_) {
+            NvVFX_SetImage(bgblurEff_, NVVFX_INPUT_IMAGE_0, &srcGPU_);
+            NvVFX_SetImage(bgblurEff_, NVVFX_INPUT_IMAGE_1, &dstGPU_);
+            NvVFX_SetImage(bgblurEff_, NVVFX_OUTPUT_IMAGE,  &blurGPU_);
+            bgblurReady_ = NvVFX_Load(bgblurEff_) == NVCV_SUCCESS;
+        }
+
         if (artifactEff_ && !artifactInited_ && artifactInGPU_.pixels && artifactOutGPU_.pixels) {
             NvVFX_SetImage(artifactEff_, NVVFX_INPUT_IMAGE,  &artifactInGPU_);
             NvVFX_SetImage(artifactEff_, NVVFX_OUTPUT_IMAGE, &artifactOutGPU_);
@@ -279,6 +395,7 @@ public:
             }
         }
 
+        fitBackground(width, height);
         bufWidth_  = width;
         bufHeight_ = height;
         return true;
@@ -296,8 +413,6 @@ public:
         NVWrapperForCVMat(&matte,  &matteW);
         NVWrapperForCVMat(&result, &resultW);
 
-        NvVFX_SetImage(eff_, NVVFX_INPUT_IMAGE,  &srcGPU_);
-        NvVFX_SetImage(eff_, NVVFX_OUTPUT_IMAGE, &dstGPU_);
         NvCVImage_Transfer(&srcW, &srcGPU_, 1.0f, stream_, NULL);
         NvVFX_SetStateObjectHandleArray(eff_, NVVFX_STATE, batchOfStates_);
 
@@ -319,18 +434,15 @@ public:
             NvCVImage_CompositeOverConstant(&srcW, &matteW, bg, &resultW, stream_);
             break;
         }
-        case MODE_LIGHT:
-            for (int y = 0; y < frame.rows; y++) {
-                for (int x = 0; x < frame.cols; x++) {
-                    float a = matte.at<uchar>(y, x) / 255.0f;
-                    auto p = frame.at<cv::Vec3b>(y, x);
-                    result.at<cv::Vec3b>(y, x) = cv::Vec3b(
-                        p[0] * (0.5f + 0.5f * a),
-                        p[1] * (0.5f + 0.5f * a),
-                        p[2] * (0.5f + 0.5f * a));
-                }
-            }
+        case MODE_LIGHT: {
+            // p * (0.5 + 0.5 * alpha), as whole-image ops instead of a
+            // per-pixel at<>() loop
+            cv::Mat matte3, lit;
+            cv::cvtColor(matte, matte3, cv::COLOR_GRAY2BGR);
+            cv::multiply(frame, matte3, lit, 0.5 / 255.0);
+            cv::addWeighted(frame, 0.5, lit, 1.0, 0.0, result);
             break;
+        }
 
         case MODE_BG:
             if (!bgImg_.empty()) {
@@ -344,17 +456,15 @@ public:
             break;
 
         case MODE_BLUR:
-            if (bgblurEff_) {
+            if (bgblurReady_) {
                 NvVFX_SetF32(bgblurEff_, NVVFX_STRENGTH, g_blurStrength.load());
-                NvVFX_SetImage(bgblurEff_, NVVFX_INPUT_IMAGE_0, &srcGPU_);
-                NvVFX_SetImage(bgblurEff_, NVVFX_INPUT_IMAGE_1, &dstGPU_);
-                NvVFX_SetImage(bgblurEff_, NVVFX_OUTPUT_IMAGE,  &blurGPU_);
-                NvVFX_Load(bgblurEff_);
                 if (NvVFX_Run(bgblurEff_, 0) == NVCV_SUCCESS) {
                     NvCVImage_Transfer(&blurGPU_, &resultW, 1.0f, stream_, NULL);
                 } else {
                     frame.copyTo(result);
                 }
+            } else {
+                frame.copyTo(result);
             }
             break;
 
@@ -381,14 +491,23 @@ public:
     }
 
     void setBackground(const std::string &path, int width, int height) {
-        bgImg_ = cv::imread(path);
-        if (!bgImg_.empty()) {
-            cv::resize(bgImg_, bgImg_, cv::Size(width, height));
+        bgSrc_ = cv::imread(path);
+        bgImg_.release();
+        if (!bgSrc_.empty()) {
+            fitBackground(width, height);
             std::cout << "Background: " << path << std::endl;
         }
     }
 
 private:
+    // Resize the decoded background to the frame size. The decoded copy is
+    // kept so a resolution change rescales it without reading the file again.
+    void fitBackground(int width, int height) {
+        if (bgSrc_.empty()) return;
+        if (bgImg_.cols == width && bgImg_.rows == height) return;
+        cv::resize(bgSrc_, bgImg_, cv::Size(width, height));
+    }
+
     void deallocateBuffers() {
         NvCVImage_Dealloc(&srcGPU_);
         NvCVImage_Dealloc(&dstGPU_);
@@ -396,6 +515,7 @@ private:
         NvCVImage_Dealloc(&artifactInGPU_);
         NvCVImage_Dealloc(&artifactOutGPU_);
         if (batchOfStates_) { free(batchOfStates_); batchOfStates_ = nullptr; }
+        bgblurReady_ = false;
         bufWidth_ = bufHeight_ = 0;
     }
 
@@ -414,18 +534,68 @@ private:
     NvVFX_Handle eff_, bgblurEff_, artifactEff_;
     CUstream stream_;
     bool inited_, artifactInited_;
+    bool bgblurReady_ = false;  // Blur effect bound to the current buffers
     int bufWidth_ = 0, bufHeight_ = 0;
 
     NvCVImage srcGPU_{}, dstGPU_{}, blurGPU_{};
     NvCVImage artifactInGPU_{}, artifactOutGPU_{};
     std::vector<NvVFX_StateObjectHandle> stateArray_;
     NvVFX_StateObjectHandle *batchOfStates_;
-    cv::Mat bgImg_;
+    cv::Mat bgSrc_, bgImg_;
 };
 
 // ══════════════════════════════════════════════════════════════════════════
 // Command Listener
 // ══════════════════════════════════════════════════════════════════════════
+// Apply one command line. Malformed numbers are reported and ignored rather
+// than letting std::stoi/stof throw out of the listener thread.
+static void handleCommand(const std::string &cmd) {
+    try {
+        if (cmd == "QUIT") {
+            g_running = false;
+        } else if (cmd == "WINDOW:visible") {
+            g_windowVisible = true;
+        } else if (cmd == "WINDOW:hidden") {
+            g_windowVisible = false;
+        } else if (cmd.rfind("MODE:", 0) == 0) {
+            g_effectMode = std::stoi(cmd.substr(5));
+        } else if (cmd.rfind("BLUR:", 0) == 0) {
+            g_blurStrength = std::stof(cmd.substr(5));
+        } else if (cmd.rfind("BG:", 0) == 0) {
+            std::lock_guard<std::mutex> lock(g_bgMutex);
+            g_bgFile = cmd.substr(3);
+            g_bgChanged = true;
+        } else if (cmd.rfind("DEVICE:", 0) == 0) {
+            std::lock_guard<std::mutex> lock(g_deviceMutex);
+            std::string dev = cmd.substr(7);
+            if (dev != g_inputDevice) {
+                g_inputDevice = dev;
+                g_deviceChanged = true;
+            }
+        } else if (cmd.rfind("RESOLUTION:", 0) == 0) {
+            std::string res = cmd.substr(11);
+            auto x = res.find('x');
+            if (x != std::string::npos) {
+                int w = std::stoi(res.substr(0, x));
+                int h = std::stoi(res.substr(x + 1));
+                if (w > 0 && h > 0) {
+                    g_cameraWidth  = w;
+                    g_cameraHeight = h;
+                    g_cameraSettingsChanged = true;
+                }
+            }
+        } else if (cmd.rfind("FPS:", 0) == 0) {
+            int fps = std::stoi(cmd.substr(4));
+            if (fps > 0 && fps <= 120) {
+                g_cameraFps = fps;
+                g_cameraSettingsChanged = true;
+            }
+        }
+    } catch (const std::exception &) {
+        std::cerr << "Ignoring malformed command: " << cmd << std::endl;
+    }
+}
+
 static void commandListener() {
     mkdir(SHARED_DIR, 0777);
     unlink(CMD_PIPE_PATH);
@@ -439,6 +609,9 @@ static void commandListener() {
             continue;
         }
 
+        // A read can end mid-line, so an incomplete trailing line is kept
+        // and completed by the next read.
+        std::string pending;
         struct pollfd pfd = {fd, POLLIN, 0};
         while (g_running) {
             int ret = poll(&pfd, 1, 500);
@@ -448,57 +621,18 @@ static void commandListener() {
             if (!(pfd.revents & POLLIN)) continue;
 
             char buf[1024];
-            ssize_t n = ::read(fd, buf, sizeof(buf) - 1);
+            ssize_t n = ::read(fd, buf, sizeof(buf));
             if (n <= 0) break;
-            buf[n] = '\0';
-
-            char *line = strtok(buf, "\n");
-            while (line) {
-                std::string cmd(line);
-
-                if (cmd == "QUIT") {
-                    g_running = false;
-                } else if (cmd == "WINDOW:visible") {
-                    g_windowVisible = true;
-                } else if (cmd == "WINDOW:hidden") {
-                    g_windowVisible = false;
-                } else if (cmd.rfind("MODE:", 0) == 0) {
-                    g_effectMode = std::stoi(cmd.substr(5));
-                } else if (cmd.rfind("BLUR:", 0) == 0) {
-                    g_blurStrength = std::stof(cmd.substr(5));
-                } else if (cmd.rfind("BG:", 0) == 0) {
-                    std::lock_guard<std::mutex> lock(g_bgMutex);
-                    g_bgFile = cmd.substr(3);
-                    g_bgChanged = true;
-                } else if (cmd.rfind("DEVICE:", 0) == 0) {
-                    std::lock_guard<std::mutex> lock(g_deviceMutex);
-                    std::string dev = cmd.substr(7);
-                    if (dev != g_inputDevice) {
-                        g_inputDevice = dev;
-                        g_deviceChanged = true;
-                    }
-                } else if (cmd.rfind("RESOLUTION:", 0) == 0) {
-                    std::string res = cmd.substr(11);
-                    auto x = res.find('x');
-                    if (x != std::string::npos) {
-                        int w = std::stoi(res.substr(0, x));
-                        int h = std::stoi(res.substr(x + 1));
-                        if (w > 0 && h > 0) {
-                            g_cameraWidth  = w;
-                            g_cameraHeight = h;
-                            g_cameraSettingsChanged = true;
-                        }
-                    }
-                } else if (cmd.rfind("FPS:", 0) == 0) {
-                    int fps = std::stoi(cmd.substr(4));
-                    if (fps > 0 && fps <= 120) {
-                        g_cameraFps = fps;
-                        g_cameraSettingsChanged = true;
-                    }
-                }
+            pending.append(buf, n);
 
-                line = strtok(nullptr, "\n");
+            size_t pos = 0, nl;
+            while ((nl = pending.find('\n', pos)) != std::string::npos) {
+                if (nl > pos) handleCommand(pending.substr(pos, nl - pos));
+                pos = nl + 1;
             }
+            pending.erase(0, pos);
+            if (pending.size() > 4096) pending.clear();  // No newline in sight; drop it
+            wakeMainLoop();
         }
         close(fd);
     }
@@ -564,6 +698,7 @@ int main(int argc, char **argv) {
     }
 
     VirtualCamera vcam;
+    PreviewShm previewShm;
     int vcamW = g_cameraWidth.load();
     int vcamH = g_cameraHeight.load();
     int vcamFps = g_cameraFps.load();
@@ -599,7 +734,7 @@ int main(int argc, char **argv) {
                 vcam.writeIdleFrame();
             }
             unlink(PREVIEW_FILE);
-            std::this_thread::sleep_for(std::chrono::milliseconds(500));
+            waitForCommand(std::chrono::milliseconds(500));
             continue;
         }
 
@@ -625,7 +760,7 @@ int main(int argc, char **argv) {
 
             if (!cap.isOpened()) {
                 std::cerr << "Cannot open camera" << std::endl;
-                std::this_thread::sleep_for(std::chrono::seconds(1));
+                waitForCommand(std::chrono::seconds(1));
                 continue;
             }
 
@@ -635,6 +770,10 @@ int main(int argc, char **argv) {
             cap.set(cv::CAP_PROP_FRAME_WIDTH,  reqW);
             cap.set(cv::CAP_PROP_FRAME_HEIGHT, reqH);
             cap.set(cv::CAP_PROP_FPS,          reqFps);
+            // Two driver buffers: one being filled while we process the
+            // other. The default ring of four lets stale frames queue up
+            // whenever an effect runs slower than the camera.
+            cap.set(cv::CAP_PROP_BUFFERSIZE,   2);
 
             curWidth  = (int)cap.get(cv::CAP_PROP_FRAME_WIDTH);
             curHeight = (int)cap.get(cv::CAP_PROP_FRAME_HEIGHT);
@@ -691,12 +830,13 @@ int main(int argc, char **argv) {
 
         vcam.writeFrame(result);
 
-        if (windowVis) {
+        if (windowVis && !previewShm.write(result)) {
             writePreviewJpeg(result);
         }
     }
 
     if (cameraActive) cap.release();
+    previewShm.close();
     unlink(PID_FILE);
     unlink(PREVIEW_FILE);
     unlink(PREVIEW_TMP);